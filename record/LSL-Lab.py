@@ -1,4 +1,6 @@
 import threading
+import queue
+import atexit
 import csv
 import time
 import tkinter as tk
@@ -29,6 +31,12 @@ CLIENT_CHAR_CONFIG = "00002902-0000-1000-8000-00805f9b34fb"
 # PMD Control Commands
 PMD_COMMAND = bytearray([0x01, 0x00, 0x00, 0x01, 0x82, 0x00, 0x01, 0x01, 0x0E, 0x00])
 
+# Recording CSV settings
+CSV_HEADER = b"Timestamp,Value\n"
+CSV_BUFFER_SIZE = 1 << 16  # Bytes buffered per recording file between writes
+WRITE_BATCH_SIZE = 256  # Max samples the writer thread drains per wake-up
+CSV_FLUSH_INTERVAL = 1.0  # Seconds between flushes of the recording files
+
 # Theme colors
 DARK_BG = "#1E1E2E"  # Dark background
 DARKER_BG = "#181825"  # Darker background for contrast
@@ -40,6 +48,90 @@ WARNING_COLOR = "#F9E2AF"  # Warning color
 ERROR_COLOR = "#F38BA8"  # Error color
 BORDER_COLOR = "#313244"  # Border color
 
+# Live preview buffer size (power of two so the write index can be masked)
+PREVIEW_BUFFER_SIZE = 1024
+PLOT_UPDATE_INTERVAL = 0.5  # Seconds between live plot updates
+
+
+class SampleRingBuffer:
+    """Fixed-size ring buffer of (timestamp, value) samples backed by a numpy array
+
+    Single producer (the BLE notification handler) and single consumer (the plot),
+    no lock: the producer writes the slot before publishing the new count, and the
+    consumer drops any slots that were overwritten while it was copying them.
+    """
+
+    def __init__(self, capacity=PREVIEW_BUFFER_SIZE):
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._data = np.zeros((capacity, 2), dtype=np.float64)
+        self.count = 0  # Total number of samples ever appended, only written by the producer
+
+    def append(self, timestamp, value):
+        """Store a sample, overwriting the oldest one when the buffer is full"""
+        count = self.count
+        self._data[count & self._mask] = (timestamp, value)
+        self.count = count + 1  # Publish only after the slot is written
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def latest(self):
+        """Return the most recent sample as a (timestamp, value) tuple"""
+        timestamp, value = self._data[(self.count - 1) & self._mask]
+        return timestamp, value
+
+    def window(self, since):
+        """Return (timestamps, values) arrays of the samples newer than `since`, oldest first"""
+        count = self.count
+        start = max(0, count - self.capacity)
+        indices = np.arange(start, count) & self._mask
+        data = self._data[indices]
+        # Slots the producer reused during the copy may hold newer samples, drop them. The slot at
+        # count & mask counts as reused too: append writes it before publishing the new count.
+        overwritten = self.count + 1 - self.capacity - start
+        if overwritten > 0:
+            data = data[overwritten:]
+        data = data[data[:, 0] >= since]
+        return data[:, 0], data[:, 1]
+
+
+class RecordingFile:
+    """Append-only recording file written with os.write through a fixed-size byte buffer"""
+
+    def __init__(self, filename, buffer_size=CSV_BUFFER_SIZE):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, 'O_BINARY', 0)
+        self._fd = os.open(filename, flags, 0o644)
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        if hasattr(os, 'posix_fadvise'):
+            # Recordings are only ever appended, let the kernel know
+            os.posix_fadvise(self._fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def write(self, data):
+        """Buffer encoded rows, writing them out once the buffer is full"""
+        self._buffer += data
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered bytes to the file"""
+        with memoryview(self._buffer) as view:
+            written = 0
+            while written < len(view):
+                written += os.write(self._fd, view[written:])
+        del self._buffer[:]
+
+    def close(self):
+        if self._fd is None:
+            return
+        try:
+            self.flush()
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
 class LSLGui:
     def __init__(self, master):
         self.master = master
@@ -165,23 +257,36 @@ class PolarStreamRecorder:
         self.recording = False
         self.recording_event = threading.Event()
         self.data_received = False  # Flag to track if data is being received
+        self.sample_event = threading.Event()  # Set whenever a heart rate sample arrives
+        self._watchdog_event = None  # asyncio counterpart of sample_event, owned by _data_watchdog
+        self._watchdog_task = None  # _data_watchdog task on the BLE loop while connected
+        self._plot_cache = {}  # Last prepared data per plotted line, see _update_stream_lines
         self.stop_event = threading.Event()
         self.recording_start_time = None  # Track when recording started
         self.connected = False
         self.client = None
         self.device_address = None
         self.data_buffers = {
-            'HeartRate': [],
-            'RRinterval': []
+            'HeartRate': SampleRingBuffer(),
+            'RRinterval': SampleRingBuffer()
         }
         self.marked_timestamps = []
         self.intervals = []  # Store completed intervals as (start, end) pairs
         self.current_interval_start = None  # Track if we're in the middle of creating an interval
         self.participant_folder = None
         self.current_participant_id = None  # Track current participant ID
+        # BLE event loop runs for the lifetime of the app so notifications are delivered as they arrive
         self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self._run_event_loop, daemon=True).start()
         self.plot_update_scheduled = False  # Flag to track if plot updates are scheduled
         
+        # Background writer for the recording files
+        self._write_queue = queue.Queue()
+        self._writer_thread = None
+        self._writer_lock = threading.Lock()  # Orders starting the writer against stopping it
+        # Write out rows still buffered by the writer if the app exits mid-recording
+        atexit.register(self._close_recording_files)
+
         # LSL streaming
         self.hr_outlet = None
         self.rr_outlet = None
@@ -437,7 +542,22 @@ class PolarStreamRecorder:
         self.figure.suptitle("Live HR & RR Data", fontsize=14, color=TEXT_COLOR)
         
         # Add a grid with low opacity
-        self.ax1.grid(True, linestyle='--', alpha=0.2)
+        self.ax1.grid(True, linestyle='--', alpha=0.2, color=BORDER_COLOR)
+
+        # Axis labels never change, so set them once
+        self.ax1.set_ylabel('Heart Rate (bpm)', color=ACCENT_COLOR, labelpad=15, va='center', fontsize=10)
+        self.ax1.tick_params(axis='y', labelcolor=ACCENT_COLOR)
+        self.ax2.set_ylabel('RR Interval (ms)', color=SUCCESS_COLOR, labelpad=15, ha='right', va='center', fontsize=10)
+        self.ax2.yaxis.set_label_position("right")
+        self.ax2.tick_params(axis='y', labelcolor=SUCCESS_COLOR)
+        self.ax1.set_xlabel("Time (Last 100s)", color=SECONDARY_TEXT, fontsize=10)
+
+        # Line artists are created once and updated in place by update_plot
+        self.hr_preview_line, = self.ax1.plot([], [], color=SECONDARY_TEXT, alpha=0.3, linewidth=1.0, label='Preview HR')
+        self.hr_line, = self.ax1.plot([], [], color=ACCENT_COLOR, linewidth=1.5, label='Heart Rate')
+        self.rr_preview_line, = self.ax2.plot([], [], color=SECONDARY_TEXT, alpha=0.3, linewidth=1.0, label='Preview RR')
+        self.rr_line, = self.ax2.plot([], [], color=SUCCESS_COLOR, linewidth=1.5, label='RR Interval')
+        self.plot_markers = []  # Recording start/stop lines, marks and interval spans
 
         self.canvas_plot = FigureCanvasTkAgg(self.figure, master=self.parent)
         self.canvas_widget = self.canvas_plot.get_tk_widget()
@@ -445,13 +565,22 @@ class PolarStreamRecorder:
 
         self.update_plot()
 
+    def _run_event_loop(self):
+        """Run the BLE event loop in its own thread"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _run_coroutine(self, coro):
+        """Run a coroutine on the BLE event loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
     def scan_devices(self):
         self.scan_button.config(text="Scanning...", state=tk.DISABLED)
         threading.Thread(target=self._scan_devices_thread, daemon=True).start()
 
     def _scan_devices_thread(self):
         try:
-            devices = self.loop.run_until_complete(self._scan_for_polar_devices())
+            devices = self._run_coroutine(self._scan_for_polar_devices())
             self.device_dropdown['values'] = devices
             if devices:
                 self.device_dropdown.current(0)
@@ -690,8 +819,8 @@ class PolarStreamRecorder:
         """Reset all session-related data"""
         # Clear data buffers
         self.data_buffers = {
-            'HeartRate': [],
-            'RRinterval': []
+            'HeartRate': SampleRingBuffer(),
+            'RRinterval': SampleRingBuffer()
         }
         
         # Clear timestamps and intervals
@@ -811,7 +940,7 @@ class PolarStreamRecorder:
                 fg=DARKER_BG
             )
             
-            self.loop.run_until_complete(self._connect_to_polar())
+            self._run_coroutine(self._connect_to_polar())
             
             # Enable recording button and mark button with dark theme styling
             self.start_button.config(
@@ -858,9 +987,6 @@ class PolarStreamRecorder:
                 activeforeground=ERROR_COLOR
             )
 
-            # Start a periodic data request to ensure preview data is continuously received
-            threading.Thread(target=self._periodic_data_request, daemon=True).start()
-            
             # Update session status
             if self.current_participant_id:
                 self.session_status_label.config(
@@ -871,10 +997,8 @@ class PolarStreamRecorder:
             # Set up LSL streams for real-time streaming
             self._setup_lsl_streams()
 
-            # Start updating the plot immediately
-            self.update_plot()
-            # Schedule regular plot updates
-            self._schedule_plot_updates()
+            # Start updating the plot immediately and keep updating it on the Tk main loop
+            self.parent.after(0, self._schedule_plot_updates)
 
             messagebox.showinfo("Connected", "Connected to Polar H10 successfully! Data preview and LSL streaming have started automatically.")
         except Exception as e:
@@ -889,12 +1013,23 @@ class PolarStreamRecorder:
                 activeforeground=ACCENT_COLOR
             )
             
-    def _schedule_plot_updates(self):
+    def _schedule_plot_updates(self, deadline=None):
         """Schedule regular plot updates"""
-        if self.connected:
-            self.update_plot()
-            # Update plot every 500ms
-            self.parent.after(500, self._schedule_plot_updates)
+        if not self.connected:
+            return
+
+        if deadline is None:
+            deadline = time.monotonic()
+        self.update_plot()
+
+        # Update plot every 500ms against absolute deadlines, so redraw time doesn't add up as drift
+        deadline += PLOT_UPDATE_INTERVAL
+        delay = deadline - time.monotonic()
+        if delay < 0:
+            # Fell behind (e.g. a slow redraw), skip the missed updates instead of catching up
+            deadline -= delay
+            delay = 0
+        self.parent.after(int(delay * 1000), self._schedule_plot_updates, deadline)
 
     def _setup_lsl_streams(self):
         """Set up LSL streams for heart rate and RR intervals"""
@@ -930,29 +1065,6 @@ class PolarStreamRecorder:
             except Exception as e:
                 print(f"Error cleaning up RR LSL stream: {str(e)}")
 
-    def _periodic_data_request(self):
-        """Periodically request data to ensure continuous data flow"""
-        while self.connected:
-            current_time = time.time()
-
-            # Check if we have recent data (within the last 3 seconds)
-            has_recent_data = False
-            if self.data_buffers['HeartRate']:
-                last_timestamp = self.data_buffers['HeartRate'][-1][0]
-                if current_time - last_timestamp < 3:
-                    has_recent_data = True
-
-            # If no recent data, request it
-            if not has_recent_data:
-                try:
-                    print("Requesting heart rate data...")
-                    threading.Thread(target=lambda: self._force_test_reading(preview_mode=True), daemon=True).start()
-                except Exception as e:
-                    print(f"Error requesting data: {str(e)}")
-
-            # Wait before next check
-            time.sleep(2)  # Check every 2 seconds
-
     async def _connect_to_polar(self):
         # Connect to the Polar H10
         try:
@@ -966,6 +1078,8 @@ class PolarStreamRecorder:
                 raise Exception("Failed to connect to device")
 
             self.connected = True
+            self.stop_event.clear()
+            self.sample_event.clear()
             self.status_var.set(f"Status: Connected to {self.device_address}")
             print(f"Successfully connected to device at {self.device_address}")
 
@@ -1062,8 +1176,11 @@ class PolarStreamRecorder:
                 print(f"Error setting up PMD data: {str(e)}")
                 print("RR intervals may still be available from the heart rate service")
 
-            # Start a watchdog to check if we're receiving data
-            threading.Thread(target=self._data_watchdog, daemon=True).start()
+            # Start a watchdog that keeps preview data flowing and checks if we're receiving data.
+            # It runs as a task on the BLE loop, next to the notification handler that wakes it.
+            if self._watchdog_task is not None:
+                self._watchdog_task.cancel()
+            self._watchdog_task = self.loop.create_task(self._data_watchdog())
 
         except Exception as e:
             self.connected = False
@@ -1073,10 +1190,11 @@ class PolarStreamRecorder:
     def _force_initial_reading(self):
         """Force an initial heart rate reading to verify connection"""
         try:
-            time.sleep(2)  # Wait for notifications to be set up
+            # Wait for notifications to be set up, returning as soon as the first sample arrives
+            self.sample_event.wait(timeout=2)
             if not self.data_buffers['HeartRate']:
                 print("No heart rate data received yet, forcing a reading...")
-                self.loop.run_until_complete(self._force_heart_rate_reading_loop())
+                self._run_coroutine(self._force_heart_rate_reading_loop())
         except Exception as e:
             print(f"Error forcing initial reading: {str(e)}")
 
@@ -1116,34 +1234,66 @@ class PolarStreamRecorder:
         except Exception as e:
             print(f"Error in force heart rate reading loop: {str(e)}")
 
-    def _data_watchdog(self):
-        """Check if we're receiving data from the device"""
-        time.sleep(5)  # Wait for initial connection
-
-        if not self.data_buffers['HeartRate']:
-            # No heart rate data received after 5 seconds
-            self.parent.after(0, lambda: self.status_var.set("Status: Connected but no data received. Check device placement."))
-            print("No heart rate data received after 5 seconds. Please check:")
-            print("1. Is the chest strap properly positioned and moistened?")
-            print("2. Is the Polar H10 sensor firmly attached to the strap?")
-            print("3. Is the battery level sufficient?")
+    async def _data_watchdog(self):
+        """Request data after short gaps and check if we're receiving data from the device"""
+        # Created here so it belongs to the BLE loop; _heart_rate_handler sets it on the same loop
+        sample_arrived = self._watchdog_event = asyncio.Event()
+        last_sample_time = time.monotonic()
+        next_check = last_sample_time + 5  # Wait for initial connection
+        initial_check = True
+        last_data_count = 0
+        consecutive_no_data = 0  # Count consecutive checks with no new data
 
-            # Try to force a reading
+        while self.connected:
+            # Sleep until the next sample arrives, a 3 second gap or the next check is due
+            timeout = max(0.0, min(last_sample_time + 3, next_check) - time.monotonic())
             try:
-                print("Attempting to force a heart rate reading...")
-                threading.Thread(target=lambda: self._force_test_reading(preview_mode=False), daemon=True).start()
-            except Exception as e:
-                print(f"Error forcing heart rate reading: {str(e)}")
+                await asyncio.wait_for(sample_arrived.wait(), timeout)
+                has_sample = True
+            except asyncio.TimeoutError:
+                has_sample = False
+            if self.stop_event.is_set():
+                break
+
+            now = time.monotonic()
+            if has_sample:
+                sample_arrived.clear()
+                last_sample_time = now
+            elif now - last_sample_time >= 3:
+                # No recent data, request it
+                last_sample_time = now
+                try:
+                    print("Requesting heart rate data...")
+                    # Forced readings block on _run_coroutine, so they cannot run on this loop
+                    threading.Thread(target=lambda: self._force_test_reading(preview_mode=True), daemon=True).start()
+                except Exception as e:
+                    print(f"Error requesting data: {str(e)}")
 
-        # Check every 15 seconds if data is still coming in (increased from 10 to reduce false warnings)
-        last_check_time = time.time()
-        last_data_count = len(self.data_buffers['HeartRate'])
-        consecutive_no_data = 0  # Count consecutive checks with no new data
+            if now < next_check:
+                continue
+            # Check every 15 seconds if data is still coming in (increased from 10 to reduce false warnings)
+            next_check = now + 15
+            # Total samples ever received; len() stops growing once the preview buffer is full
+            current_data_count = self.data_buffers['HeartRate'].count
 
-        while self.connected:
-            time.sleep(15)  # Increased from 10 seconds
-            current_time = time.time()
-            current_data_count = len(self.data_buffers['HeartRate'])
+            if initial_check:
+                initial_check = False
+                last_data_count = current_data_count
+                if not current_data_count:
+                    # No heart rate data received after 5 seconds
+                    self.parent.after(0, lambda: self.status_var.set("Status: Connected but no data received. Check device placement."))
+                    print("No heart rate data received after 5 seconds. Please check:")
+                    print("1. Is the chest strap properly positioned and moistened?")
+                    print("2. Is the Polar H10 sensor firmly attached to the strap?")
+                    print("3. Is the battery level sufficient?")
+
+                    # Try to force a reading
+                    try:
+                        print("Attempting to force a heart rate reading...")
+                        threading.Thread(target=lambda: self._force_test_reading(preview_mode=False), daemon=True).start()
+                    except Exception as e:
+                        print(f"Error forcing heart rate reading: {str(e)}")
+                continue
 
             if current_data_count == last_data_count:
                 consecutive_no_data += 1
@@ -1168,7 +1318,6 @@ class PolarStreamRecorder:
                 # Data is coming in
                 self.data_received = True
                 last_data_count = current_data_count
-                last_check_time = current_time
                 consecutive_no_data = 0  # Reset counter
 
                 # If we're getting data but not recording, remind the user
@@ -1197,6 +1346,9 @@ class PolarStreamRecorder:
 
             # Set flag that data is being received
             self.data_received = True
+            self.sample_event.set()
+            if self._watchdog_event is not None:
+                self._watchdog_event.set()
 
             # Update status with latest heart rate
             if self.recording:
@@ -1205,7 +1357,7 @@ class PolarStreamRecorder:
                 self.status_var.set(f"Status: Connected | HR: {hr_value} bpm")
 
             # Always add to data buffer for display purposes
-            self.data_buffers['HeartRate'].append((timestamp, hr_value))
+            self.data_buffers['HeartRate'].append(timestamp, hr_value)
 
             # Push to LSL stream if available
             if self.hr_outlet:
@@ -1214,19 +1366,13 @@ class PolarStreamRecorder:
                 except Exception as e:
                     print(f"Error pushing HR to LSL stream: {str(e)}")
 
-            # Limit buffer size to prevent memory issues
-            if len(self.data_buffers['HeartRate']) > 1000:
-                # Keep only the most recent 1000 points
-                self.data_buffers['HeartRate'] = self.data_buffers['HeartRate'][-1000:]
-
             # If first data point, log it
             if len(self.data_buffers['HeartRate']) == 1:
                 print(f"First heart rate data received: {hr_value} bpm")
 
-            # Only save to file if recording
+            # Only save to file if recording (written by the writer thread)
             if self.recording:
-                # Use a more efficient approach to file writing
-                self._write_hr_data_to_file(timestamp, hr_value)
+                self._write_queue.put(('HeartRate', timestamp, hr_value))
 
             # Check for RR intervals
             if has_rr:
@@ -1236,35 +1382,91 @@ class PolarStreamRecorder:
                 if hr_format:
                     rr_offset = 3  # RR values start after the 2-byte heart rate value
 
-                for i in range(rr_count):
-                    rr_value = struct.unpack('<H', data[rr_offset + i*2:rr_offset + i*2 + 2])[0]
-                    # Convert to milliseconds
-                    rr_ms = (rr_value / 1024) * 1000
+                # Unpack all RR values of the notification at once and convert to milliseconds
+                rr_values = [(rr_value / 1024) * 1000
+                             for rr_value in struct.unpack_from(f'<{rr_count}H', data, rr_offset)]
 
+                for rr_ms in rr_values:
                     # Always add to data buffer for display
-                    self.data_buffers['RRinterval'].append((timestamp, rr_ms))
-
-                    # Push to LSL stream if available
-                    if self.rr_outlet:
-                        try:
-                            self.rr_outlet.push_sample([float(rr_ms)])
-                        except Exception as e:
-                            print(f"Error pushing RR to LSL stream: {str(e)}")
-
-                    # Limit buffer size
-                    if len(self.data_buffers['RRinterval']) > 1000:
-                        self.data_buffers['RRinterval'] = self.data_buffers['RRinterval'][-1000:]
+                    self.data_buffers['RRinterval'].append(timestamp, rr_ms)
 
-                    # Only save to file if recording
+                    # Only save to file if recording (written by the writer thread)
                     if self.recording:
-                        # Use a more efficient approach to file writing
-                        self._write_rr_data_to_file(timestamp, rr_ms)
+                        self._write_queue.put(('RRinterval', timestamp, rr_ms))
+
+                # Push to LSL stream if available. One sample per value, so each one gets the arrival
+                # time; push_chunk would backdate all but the last by the 10 Hz nominal rate.
+                if self.rr_outlet:
+                    try:
+                        for rr_ms in rr_values:
+                            self.rr_outlet.push_sample([rr_ms])
+                    except Exception as e:
+                        print(f"Error pushing RR to LSL stream: {str(e)}")
 
         except Exception as e:
             print(f"Error processing heart rate data: {str(e)}")
 
-    def _write_hr_data_to_file(self, timestamp, hr_value):
-        """Write heart rate data to file with better error handling"""
+    def _writer_loop(self, write_queue):
+        """Drain queued samples in batches and write them to the recording files"""
+        last_flush = time.monotonic()
+        while True:
+            # Wait for the next sample, then take whatever else is already waiting
+            try:
+                batch = [write_queue.get(timeout=CSV_FLUSH_INTERVAL)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Group the batch per stream so each file gets a single write call
+            stop = False
+            hr_rows = []
+            rr_rows = []
+            for item in batch:
+                if item is None:  # Sentinel from _stop_writer_thread
+                    stop = True
+                    continue
+                stream_name, timestamp, value = item
+                if stream_name == 'HeartRate':
+                    hr_rows.append((timestamp, value))
+                else:
+                    rr_rows.append((timestamp, value))
+
+            if hr_rows:
+                self._write_hr_data_to_file(hr_rows)
+            if rr_rows:
+                self._write_rr_data_to_file(rr_rows)
+
+            if stop:
+                return
+
+            # Flush periodically rather than after every row
+            if time.monotonic() - last_flush >= CSV_FLUSH_INTERVAL:
+                self._flush_recording_files()
+                last_flush = time.monotonic()
+
+    def _flush_recording_files(self):
+        """Flush buffered rows of the open recording files to disk"""
+        for file in (getattr(self, '_hr_file', None), getattr(self, '_rr_file', None)):
+            if file is not None:
+                try:
+                    file.flush()
+                except Exception as e:
+                    print(f"Error flushing recording file: {str(e)}")
+
+    def _stop_writer_thread(self):
+        """Write out pending samples and stop the writer thread"""
+        with self._writer_lock:
+            writer_thread, self._writer_thread = self._writer_thread, None
+        if writer_thread is not None:
+            self._write_queue.put(None)
+            writer_thread.join(timeout=5)
+
+    def _write_hr_data_to_file(self, rows):
+        """Write a batch of (timestamp, heart rate) rows to file with better error handling"""
         try:
             # Check if we have a cached file handle
             if not hasattr(self, '_hr_file') or self._hr_file is None:
@@ -1274,18 +1476,15 @@ class PolarStreamRecorder:
                     # Create directory if needed
                     os.makedirs(os.path.dirname(csv_filename), exist_ok=True)
                     # Create file with header
-                    with open(csv_filename, 'w', newline='') as csvfile:
-                        csv_writer = csv.writer(csvfile)
-                        csv_writer.writerow(['Timestamp', 'Value'])
+                    with open(csv_filename, 'wb') as csvfile:
+                        csvfile.write(CSV_HEADER)
 
-                # Open file for appending
-                self._hr_file = open(csv_filename, 'a', newline='')
-                self._hr_writer = csv.writer(self._hr_file)
+                # Open file for appending (raw os.write, 64 KiB buffer)
+                self._hr_file = RecordingFile(csv_filename)
                 print(f"Opened HR file for writing: {csv_filename}")
 
-            # Write data
-            self._hr_writer.writerow([timestamp, hr_value])
-            self._hr_file.flush()  # Ensure data is written immediately
+            # Write the pre-formatted rows in one call, bypassing the csv module
+            self._hr_file.write("".join([f"{timestamp:.6f},{hr_value}\n" for timestamp, hr_value in rows]).encode())
 
         except Exception as e:
             print(f"Error writing HR data to file: {str(e)}")
@@ -1297,8 +1496,8 @@ class PolarStreamRecorder:
                 except:
                     pass
 
-    def _write_rr_data_to_file(self, timestamp, rr_value):
-        """Write RR interval data to file with better error handling"""
+    def _write_rr_data_to_file(self, rows):
+        """Write a batch of (timestamp, RR interval) rows to file with better error handling"""
         try:
             # Check if we have a cached file handle
             if not hasattr(self, '_rr_file') or self._rr_file is None:
@@ -1308,18 +1507,15 @@ class PolarStreamRecorder:
                     # Create directory if needed
                     os.makedirs(os.path.dirname(csv_filename), exist_ok=True)
                     # Create file with header
-                    with open(csv_filename, 'w', newline='') as csvfile:
-                        csv_writer = csv.writer(csvfile)
-                        csv_writer.writerow(['Timestamp', 'Value'])
+                    with open(csv_filename, 'wb') as csvfile:
+                        csvfile.write(CSV_HEADER)
 
-                # Open file for appending
-                self._rr_file = open(csv_filename, 'a', newline='')
-                self._rr_writer = csv.writer(self._rr_file)
+                # Open file for appending (raw os.write, 64 KiB buffer)
+                self._rr_file = RecordingFile(csv_filename)
                 print(f"Opened RR file for writing: {csv_filename}")
 
-            # Write data
-            self._rr_writer.writerow([timestamp, rr_value])
-            self._rr_file.flush()  # Ensure data is written immediately
+            # Write the pre-formatted rows in one call, bypassing the csv module
+            self._rr_file.write("".join([f"{timestamp:.6f},{rr_value:.6f}\n" for timestamp, rr_value in rows]).encode())
 
         except Exception as e:
             print(f"Error writing RR data to file: {str(e)}")
@@ -1341,16 +1537,19 @@ class PolarStreamRecorder:
         if not self.recording:
             # Start recording
             try:
-                # Set up recording files
-                threading.Thread(target=self._setup_recording_files, daemon=True).start()
+                # Fresh queue for this recording; the writer thread is started once the files exist
+                self._write_queue = queue.Queue()
 
                 # Mark the start of recording time
                 self.recording_start_time = local_clock()
                 print(f"Recording start time: {self.recording_start_time}")
 
-                # Set recording flags
+                # Set recording flags before the setup thread checks them to start the writer
                 self.recording = True
                 self.recording_event.set()
+
+                # Set up recording files
+                threading.Thread(target=self._setup_recording_files, daemon=True).start()
                 
                 # Update UI to reflect recording started
                 self._update_recording_ui_state(True)
@@ -1386,16 +1585,15 @@ class PolarStreamRecorder:
             # Create CSV files with headers
             for stream_name in self.data_buffers.keys():
                 csv_filename = os.path.join(self.participant_folder, f"{stream_name}_recording.csv")
-                with open(csv_filename, 'w', newline='') as csvfile:
-                    csv_writer = csv.writer(csvfile)
-                    csv_writer.writerow(['Timestamp', 'Value'])
+                with open(csv_filename, 'wb') as csvfile:
+                    csvfile.write(CSV_HEADER)
                 print(f"Created file: {csv_filename}")
 
             # Create a file for marked timestamps
             marked_filename = os.path.join(self.participant_folder, "marked_timestamps.csv")
             with open(marked_filename, 'w', newline='') as csvfile:
                 csv_writer = csv.writer(csvfile)
-                csv_writer.writerow(['Timestamp'])
+                csv_writer.writerow(['Marked Timestamp'])
                 print(f"Created file: {marked_filename}")
                 
             # Create a file for intervals
@@ -1407,11 +1605,24 @@ class PolarStreamRecorder:
 
             print(f"Recording files created in {self.participant_folder}")
 
+            # Start writing queued samples now that the files have their headers. Under the lock, so a
+            # stop either sees this writer or has already cleared self.recording and none is started.
+            with self._writer_lock:
+                if self.recording:
+                    self._writer_thread = threading.Thread(target=self._writer_loop, args=(self._write_queue,),
+                                                           daemon=True)
+                    self._writer_thread.start()
+
             # Start a thread to monitor recording
             threading.Thread(target=self._monitor_recording, daemon=True).start()
 
         except Exception as e:
             print(f"Error in setup_recording_files: {str(e)}")
+            # No writer will drain the queue, so stop queuing samples and drop those already queued
+            self.recording = False
+            self.recording_event.clear()
+            self._write_queue = queue.Queue()
+            self.parent.after(0, lambda: self._update_recording_ui_state(False))
             # Notify the user of the error
             self.parent.after(0, lambda: messagebox.showerror("Recording Error", 
                                                              f"Failed to set up recording files: {str(e)}"))
@@ -1421,8 +1632,9 @@ class PolarStreamRecorder:
         if not self.recording:
             return
 
-        # Wait a few seconds for data to start coming in
-        time.sleep(5)
+        # Wait a few seconds for data to start coming in (stop early on disconnect)
+        if self.stop_event.wait(timeout=5):
+            return
 
         # Check if any data has been recorded
         try:
@@ -1516,6 +1728,9 @@ class PolarStreamRecorder:
 
     def _close_recording_files(self):
         """Close any open file handles"""
+        # Let the writer thread finish pending samples before closing the files
+        self._stop_writer_thread()
+
         # Close heart rate file
         if hasattr(self, '_hr_file') and self._hr_file is not None:
             try:
@@ -1654,204 +1869,140 @@ class PolarStreamRecorder:
         # Save timestamps
         if self.marked_timestamps:
             marked_filename = os.path.join(self.participant_folder, "marked_timestamps.csv")
-            with open(marked_filename, 'w', newline='') as marked_file:
-                csv_writer = csv.writer(marked_file)
-                csv_writer.writerow(['Timestamp'])
-                csv_writer.writerows([[ts] for ts in self.marked_timestamps])
-                
+            np.savetxt(marked_filename, np.asarray(self.marked_timestamps, dtype=np.float64),
+                       fmt='%.6f', header='Marked Timestamp', comments='')
+
         # Save intervals
         if self.intervals:
             intervals_filename = os.path.join(self.participant_folder, "intervals.csv")
-            with open(intervals_filename, 'w', newline='') as intervals_file:
-                csv_writer = csv.writer(intervals_file)
-                csv_writer.writerow(['Start_Timestamp', 'End_Timestamp', 'Duration'])
-                for start, end in self.intervals:
-                    duration = end - start
-                    csv_writer.writerow([start, end, duration])
-                    
+            bounds = np.asarray(self.intervals, dtype=np.float64)
+            rows = np.column_stack((bounds, bounds[:, 1] - bounds[:, 0]))
+            np.savetxt(intervals_filename, rows, fmt='%.6f', delimiter=',',
+                       header='Start_Timestamp,End_Timestamp,Duration', comments='')
+
         # Handle incomplete interval
         if self.current_interval_start is not None:
             print(f"Warning: Incomplete interval detected (started at {self.current_interval_start:.2f})")
             # Optionally, you could auto-complete it here or save it separately
 
+    def _update_stream_lines(self, buffer, preview_line, line, current_time, label, recording_label):
+        """Update the preview/main line pair of one stream, return the plotted values or None"""
+        # Only re-prepare the line data when new samples arrived or the recording state changed,
+        # the plot timer runs far more often than the ~1 Hz heart rate notifications
+        key = (buffer, buffer.count, self.recording, getattr(self, 'recording_start_time', None))
+        cached = self._plot_cache.get(line)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        # Limit to last 100 seconds of data
+        times, values = buffer.window(current_time - 100)
+        empty = np.empty(0)
+
+        if self.recording and hasattr(self, 'recording_start_time'):
+            # If recording, show pre-recording data in lighter color and recording data in bold
+            is_recording = times >= self.recording_start_time
+            is_preview = ~is_recording
+            preview_line.set_data(times[is_preview], values[is_preview])
+            line.set_data(times[is_recording], values[is_recording])
+            line.set_linewidth(2.0)
+            line.set_label(recording_label)
+            has_data = is_recording.any()
+        else:
+            # Regular display for preview mode
+            preview_line.set_data(empty, empty)
+            line.set_data(times, values)
+            line.set_linewidth(1.5)
+            line.set_label(label)
+            has_data = times.size > 0
+
+        result = values if has_data else None
+        self._plot_cache[line] = (key, result)
+        return result
+
     def update_plot(self):
         try:
-            self.ax1.clear()
-            self.ax2.clear()
-            has_hr_data = False
-            has_rr_data = False
             current_time = local_clock()
 
-            # Set dark theme styling for the plot
-            self.ax1.set_facecolor(DARK_BG)
-            self.ax2.set_facecolor(DARK_BG)
-            
-            self.ax1.tick_params(colors=SECONDARY_TEXT)
-            self.ax2.tick_params(colors=SECONDARY_TEXT)
-            
-            for spine in ['bottom', 'top', 'right', 'left']:
-                self.ax1.spines[spine].set_color(BORDER_COLOR)
-                self.ax2.spines[spine].set_color(BORDER_COLOR)
-
             # Plot heart rate data
-            if 'HeartRate' in self.data_buffers and self.data_buffers['HeartRate']:
-                # Limit to last 100 seconds of data
-                hr_data = [(ts, val) for ts, val in self.data_buffers['HeartRate'] if current_time - ts <= 100]
-
-                if hr_data:
-                    # If recording, split data into pre-recording and recording data
-                    if self.recording and hasattr(self, 'recording_start_time'):
-                        pre_recording_hr = [(ts, val) for ts, val in hr_data if ts < self.recording_start_time]
-                        recording_hr = [(ts, val) for ts, val in hr_data if ts >= self.recording_start_time]
-
-                        # Plot pre-recording data in lighter color
-                        if pre_recording_hr:
-                            timestamps_pre, values_pre = zip(*pre_recording_hr)
-                            self.ax1.plot(timestamps_pre, values_pre, color=SECONDARY_TEXT, alpha=0.3, linewidth=1.0, label='Preview HR')
-
-                        # Plot recording data in bold
-                        if recording_hr:
-                            timestamps_rec, values_rec = zip(*recording_hr)
-                            self.ax1.plot(timestamps_rec, values_rec, color=ACCENT_COLOR, linewidth=2.0, label='Recording HR')
-                            has_hr_data = True
-                    else:
-                        # Regular display for preview mode
-                        timestamps_hr, values_hr = zip(*hr_data)
-                        self.ax1.plot(timestamps_hr, values_hr, color=ACCENT_COLOR, label='Heart Rate', linewidth=1.5)
-                        has_hr_data = True
-
-                    # Set y-axis limits with some padding to prevent jumping
-                    if has_hr_data:
-                        all_values = [val for _, val in hr_data]
-                        if all_values:
-                            min_val = max(0, min(all_values) - 5)
-                            max_val = max(all_values) + 5
-                            self.ax1.set_ylim(min_val, max_val)
-
-                self.ax1.set_ylabel('Heart Rate (bpm)', color=ACCENT_COLOR, labelpad=15, va='center', fontsize=10)
-                self.ax1.tick_params(axis='y', labelcolor=ACCENT_COLOR)
+            hr_values = self._update_stream_lines(self.data_buffers['HeartRate'], self.hr_preview_line,
+                                                  self.hr_line, current_time, 'Heart Rate', 'Recording HR')
+            if hr_values is not None:
+                # Set y-axis limits with some padding to prevent jumping
+                self.ax1.set_ylim(max(0, hr_values.min() - 5), hr_values.max() + 5)
 
             # Plot RR interval data
-            if 'RRinterval' in self.data_buffers and self.data_buffers['RRinterval']:
-                # Limit to last 100 seconds of data
-                rr_data = [(ts, val) for ts, val in self.data_buffers['RRinterval'] if current_time - ts <= 100]
-
-                if rr_data:
-                    # If recording, split data into pre-recording and recording data
-                    if self.recording and hasattr(self, 'recording_start_time'):
-                        pre_recording_rr = [(ts, val) for ts, val in rr_data if ts < self.recording_start_time]
-                        recording_rr = [(ts, val) for ts, val in rr_data if ts >= self.recording_start_time]
-
-                        # Plot pre-recording data in lighter color
-                        if pre_recording_rr:
-                            timestamps_pre, values_pre = zip(*pre_recording_rr)
-                            self.ax2.plot(timestamps_pre, values_pre, color=SECONDARY_TEXT, alpha=0.3, linewidth=1.0, label='Preview RR')
-
-                        # Plot recording data in bold
-                        if recording_rr:
-                            timestamps_rec, values_rec = zip(*recording_rr)
-                            self.ax2.plot(timestamps_rec, values_rec, color=SUCCESS_COLOR, linewidth=2.0, label='Recording RR')
-                            has_rr_data = True
-                    else:
-                        # Regular display for preview mode
-                        timestamps_rr, values_rr = zip(*rr_data)
-                        self.ax2.plot(timestamps_rr, values_rr, color=SUCCESS_COLOR, label='RR Interval', linewidth=1.5)
-                        has_rr_data = True
-
-                    # Set y-axis limits with some padding to prevent jumping
-                    if has_rr_data:
-                        all_values = [val for _, val in rr_data]
-                        if all_values:
-                            min_val = max(0, min(all_values) - 50)
-                            max_val = max(all_values) + 50
-                            self.ax2.set_ylim(min_val, max_val)
-
-                self.ax2.set_ylabel('RR Interval (ms)', color=SUCCESS_COLOR, labelpad=15, ha='right', va='center', fontsize=10)
-                self.ax2.yaxis.set_label_position("right")
-                self.ax2.tick_params(axis='y', labelcolor=SUCCESS_COLOR)
+            rr_values = self._update_stream_lines(self.data_buffers['RRinterval'], self.rr_preview_line,
+                                                  self.rr_line, current_time, 'RR Interval', 'Recording RR')
+            if rr_values is not None:
+                self.ax2.set_ylim(max(0, rr_values.min() - 50), rr_values.max() + 50)
 
             # Set x-axis limits to prevent horizontal jumping
-            if has_hr_data or has_rr_data:
+            if hr_values is not None or rr_values is not None:
                 self.ax1.set_xlim(current_time - 100, current_time)
 
-            self.ax1.set_xlabel("Time (Last 100s)", color=SECONDARY_TEXT, fontsize=10)
-            self.ax1.grid(True, linestyle='--', alpha=0.2, color=BORDER_COLOR)
-
-            # Create combined legend with both HR and RR data
-            if self.recording:
-                # Create a list of legend handles and labels from both axes
-                handles1, labels1 = self.ax1.get_legend_handles_labels()
-                handles2, labels2 = self.ax2.get_legend_handles_labels()
-                
-                # Combine them and create a single legend
+            # Combined legend with the HR and RR lines that currently show data
+            handles = [line for line in (self.hr_preview_line, self.hr_line, self.rr_preview_line, self.rr_line)
+                       if len(line.get_xdata())]
+            if handles:
                 legend = self.ax1.legend(
-                    handles1 + handles2, 
-                    labels1 + labels2, 
-                    loc='upper left', 
-                    facecolor=DARKER_BG, 
+                    handles,
+                    [line.get_label() for line in handles],
+                    loc='upper left',
+                    facecolor=DARKER_BG,
                     edgecolor=BORDER_COLOR
                 )
-                
+
                 for text in legend.get_texts():
                     text.set_color(TEXT_COLOR)
-            else:
-                # For preview mode, also show both HR and RR in legend
-                handles1, labels1 = self.ax1.get_legend_handles_labels()
-                handles2, labels2 = self.ax2.get_legend_handles_labels()
-                
-                if handles1 or handles2:
-                    legend = self.ax1.legend(
-                        handles1 + handles2, 
-                        labels1 + labels2, 
-                        loc='upper left', 
-                        facecolor=DARKER_BG, 
-                        edgecolor=BORDER_COLOR
-                    )
-                    
-                    for text in legend.get_texts():
-                        text.set_color(TEXT_COLOR)
+            elif self.ax1.get_legend() is not None:
+                self.ax1.get_legend().remove()
+
+            # Recreate the markers, there are only a handful of them
+            for artist in self.plot_markers:
+                artist.remove()
+            self.plot_markers = []
 
             # Add a vertical line at recording start time if recording
             if self.recording and hasattr(self, 'recording_start_time'):
                 if current_time - self.recording_start_time <= 100:  # Only if recording start is within view
-                    self.ax1.axvline(
+                    self.plot_markers.append(self.ax1.axvline(
                         x=self.recording_start_time, 
                         color=SUCCESS_COLOR, 
                         linestyle='--', 
                         alpha=0.8,
                         label='Recording Start'
-                    )
+                    ))
             
             # Add a vertical line at recording stop time if available
             if hasattr(self, 'recording_stop_time') and not self.recording:
                 if current_time - self.recording_stop_time <= 100:  # Only if stop time is within view
-                    self.ax1.axvline(
+                    self.plot_markers.append(self.ax1.axvline(
                         x=self.recording_stop_time, 
                         color=ERROR_COLOR, 
                         linestyle='--', 
                         alpha=0.8,
                         label='Recording Stop'
-                    )
+                    ))
 
             # Add marked timestamps as vertical lines
             for ts in self.marked_timestamps:
                 if current_time - ts <= 100:  # Only if timestamp is within view
-                    self.ax1.axvline(x=ts, color='m', linestyle=':', alpha=0.7, label='Marked Timestamp' if ts == self.marked_timestamps[0] else "")
+                    self.plot_markers.append(self.ax1.axvline(x=ts, color='m', linestyle=':', alpha=0.7, label='Marked Timestamp' if ts == self.marked_timestamps[0] else ""))
                     
             # Add completed intervals as shaded regions
             for i, (start, end) in enumerate(self.intervals):
                 if current_time - end <= 100:  # Only if interval end is within view
-                    self.ax1.axvspan(start, end, alpha=0.2, color='cyan', 
-                                   label='Completed Intervals' if i == 0 else "")
+                    self.plot_markers.append(self.ax1.axvspan(start, end, alpha=0.2, color='cyan', 
+                                   label='Completed Intervals' if i == 0 else ""))
                     
             # Add current active interval as shaded region
             if self.current_interval_start is not None:
                 if current_time - self.current_interval_start <= 100:  # Only if interval start is within view
-                    self.ax1.axvspan(self.current_interval_start, current_time, alpha=0.3, color='yellow',
-                                   label='Active Interval')
+                    self.plot_markers.append(self.ax1.axvspan(self.current_interval_start, current_time, alpha=0.3, color='yellow',
+                                   label='Active Interval'))
 
-            # Draw the plot
-            self.canvas_plot.draw()
+            # Redraw on the next idle cycle instead of blocking here
+            self.canvas_plot.draw_idle()
 
         except Exception as e:
             print(f"Error updating plot: {str(e)}")
@@ -1874,7 +2025,7 @@ class PolarStreamRecorder:
 
         print("2. Testing data reception...")
         if len(self.data_buffers['HeartRate']) > 0:
-            last_hr = self.data_buffers['HeartRate'][-1][1]
+            _, last_hr = self.data_buffers['HeartRate'].latest()
             print(f"✓ Heart rate data is being received (last value: {last_hr} bpm)")
         else:
             print("✗ No heart rate data has been received")
@@ -1889,7 +2040,7 @@ class PolarStreamRecorder:
             threading.Thread(target=self._force_test_reading, daemon=True).start()
 
         if len(self.data_buffers['RRinterval']) > 0:
-            last_rr = self.data_buffers['RRinterval'][-1][1]
+            _, last_rr = self.data_buffers['RRinterval'].latest()
             print(f"✓ RR interval data is being received (last value: {last_rr} ms)")
         else:
             print("ℹ No RR interval data has been received (this is optional)")
@@ -1926,7 +2077,7 @@ class PolarStreamRecorder:
             if preview_mode:
                 try:
                     # Just try to read heart rate directly
-                    hr_value = self.loop.run_until_complete(self._read_heart_rate())
+                    hr_value = self._run_coroutine(self._read_heart_rate())
                     if hr_value:
                         return
                 except Exception as e:
@@ -1934,15 +2085,16 @@ class PolarStreamRecorder:
                     pass
 
             # Standard approach
-            self.loop.run_until_complete(self._force_heart_rate_reading_loop())
+            self.sample_event.clear()
+            self._run_coroutine(self._force_heart_rate_reading_loop())
 
-            # Wait a moment to see if data arrives
-            time.sleep(1 if preview_mode else 2)
+            # Wait a moment to see if data arrives, returning as soon as it does
+            self.sample_event.wait(timeout=1 if preview_mode else 2)
 
             # If still no data and not in preview mode, try a more aggressive approach
             if not self.data_buffers['HeartRate'] and not preview_mode:
                 print("Standard approach failed. Trying more aggressive methods...")
-                self.loop.run_until_complete(self._aggressive_heart_rate_test())
+                self._run_coroutine(self._aggressive_heart_rate_test())
         except Exception as e:
             print(f"Error in force test reading: {str(e)}")
 
@@ -2032,6 +2184,9 @@ class PolarStreamRecorder:
         if self.recording:
             self.stop_recording()
 
+        # Wake up the monitoring threads so they exit without waiting for their next check
+        self.stop_event.set()
+
         threading.Thread(target=self._disconnect_thread, daemon=True).start()
 
     def _disconnect_thread(self):
@@ -2044,8 +2199,13 @@ class PolarStreamRecorder:
                 fg=DARKER_BG
             )
 
+            # Stop the watchdog; the task can only be cancelled from its own loop
+            if self._watchdog_task is not None:
+                self.loop.call_soon_threadsafe(self._watchdog_task.cancel)
+                self._watchdog_task = None
+
             if self.client and self.client.is_connected:
-                self.loop.run_until_complete(self._disconnect_from_polar())
+                self._run_coroutine(self._disconnect_from_polar())
 
             self.connected = False
             
@@ -1,11 +1,19 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from scipy.interpolate import interp1d
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, fall back to the NumPy implementation
+    njit = None
 
 # Directory containing participant data (relative to script location)
 base_dir = "./Participant_Data"
 
+# Columns of the output table
+RESULT_COLUMNS = ["Participant", "Segment", "RMSSD", "SDNN", "pNN50"]
+
 
 # Functions for HRV metrics
 def calculate_rmssd(rr_intervals):
@@ -26,39 +34,116 @@ def calculate_pnn50(rr_intervals):
     return pnn50
 
 
-# Function to remove outliers and interpolate
+# Single-pass outlier removal and interpolation, compiled with numba when available
+def _clean_rr_kernel(rr_intervals):
+    n = rr_intervals.size
+
+    # Mean and standard deviation in one pass (Welford)
+    mean = 0.0
+    m2 = 0.0
+    for i in range(n):
+        delta = rr_intervals[i] - mean
+        mean += delta / (i + 1)
+        m2 += delta * (rr_intervals[i] - mean)
+    std_dev = np.sqrt(m2 / n)
+    lower = mean - 3 * std_dev
+    upper = mean + 3 * std_dev
+
+    # Keep valid samples and linearly interpolate the outliers between them
+    cleaned = np.empty(n)
+    first = -1
+    second = -1
+    last = -1
+    before_last = -1
+    for i in range(n):
+        value = rr_intervals[i]
+        if value > lower and value < upper:
+            cleaned[i] = value
+            if last >= 0 and i - last > 1:
+                slope = (value - cleaned[last]) / (i - last)
+                for j in range(last + 1, i):
+                    cleaned[j] = cleaned[last] + slope * (j - last)
+            if first < 0:
+                first = i
+            elif second < 0:
+                second = i
+            before_last = last
+            last = i
+
+    if first < 0:
+        raise ValueError("no RR intervals within 3 standard deviations of the mean")
+    if second < 0:
+        # Not enough valid samples to extrapolate, hold the single valid value
+        for i in range(n):
+            cleaned[i] = rr_intervals[first]
+        return cleaned
+
+    # Linearly extrapolate leading and trailing outliers from the nearest valid pair
+    slope = (cleaned[second] - cleaned[first]) / (second - first)
+    for i in range(first):
+        cleaned[i] = cleaned[first] + slope * (i - first)
+    slope = (cleaned[last] - cleaned[before_last]) / (last - before_last)
+    for i in range(last + 1, n):
+        cleaned[i] = cleaned[last] + slope * (i - last)
+
+    return cleaned
+
+
+if njit is not None:
+    _clean_rr_kernel = njit(cache=True)(_clean_rr_kernel)
+
+
+# Function to remove outliers and interpolate.
+# Raises ValueError if no interval is left to interpolate from (empty, constant or NaN input).
 def clean_rr_intervals(rr_intervals):
-    mean = np.mean(rr_intervals)
-    std_dev = np.std(rr_intervals)
+    rr_intervals = np.ascontiguousarray(rr_intervals, dtype=np.float64)
+    if rr_intervals.size == 0:
+        raise ValueError("no RR intervals to clean")
+    if njit is not None:
+        return _clean_rr_kernel(rr_intervals)
+
+    mean = rr_intervals.mean()
+    std_dev = rr_intervals.std()
 
     # Identify outliers (values beyond 3 standard deviations)
     non_outliers = (rr_intervals > mean - 3 * std_dev) & (rr_intervals < mean + 3 * std_dev)
 
     # Create a cleaned series
-    cleaned = rr_intervals[non_outliers]
+    valid_indices = np.flatnonzero(non_outliers)
+    if valid_indices.size == 0:
+        raise ValueError("no RR intervals within 3 standard deviations of the mean")
+    cleaned = rr_intervals[valid_indices]
 
     # Interpolate missing values (outliers removed)
-    indices = np.arange(len(rr_intervals))
-    valid_indices = indices[non_outliers]
-    interpolator = interp1d(valid_indices, cleaned, kind="linear", bounds_error=False, fill_value="extrapolate")
+    indices = np.arange(rr_intervals.size)
+    interpolated = np.interp(indices, valid_indices, cleaned)
 
-    interpolated = interpolator(indices)
-    return interpolated
+    # np.interp holds the edge values, extrapolate leading and trailing outliers linearly instead
+    if valid_indices.size > 1:
+        head = indices[:valid_indices[0]]
+        slope = (cleaned[1] - cleaned[0]) / (valid_indices[1] - valid_indices[0])
+        interpolated[head] = cleaned[0] + slope * (head - valid_indices[0])
 
-# Process all folders inside Participant_Data
-results = []
-for participant in os.listdir(base_dir):
-    participant_dir = os.path.join(base_dir, participant)
+        tail = indices[valid_indices[-1] + 1:]
+        slope = (cleaned[-1] - cleaned[-2]) / (valid_indices[-1] - valid_indices[-2])
+        interpolated[tail] = cleaned[-1] + slope * (tail - valid_indices[-1])
 
-    if not os.path.isdir(participant_dir):
-        continue  # Skip files
+    return interpolated
 
+
+# Process a single participant folder and return its result columns
+def process_participant(participant_dir, participant):
     rr_file = os.path.join(participant_dir, "RRinterval_recording.csv")
     timestamp_file = os.path.join(participant_dir, "marked_timestamps.csv")
 
     if not os.path.exists(rr_file) or not os.path.exists(timestamp_file):
         print(f"Missing required files for {participant}. Skipping.")
-        continue
+        return {column: [] for column in RESULT_COLUMNS}
+
+    segment_col = []
+    rmssd_col = []
+    sdnn_col = []
+    pnn50_col = []
 
     rr_data = pd.read_csv(rr_file)
     timestamps = pd.read_csv(timestamp_file)
@@ -66,61 +151,105 @@ for participant in os.listdir(base_dir):
     if rr_data['Value'].max() < 10:  # assuming intervals less than 10 are in seconds
         rr_data['Value'] *= 1000
 
-    # Ensure timestamps are properly formatted
-    rr_data['Timestamp'] = pd.to_datetime(rr_data['Timestamp'], unit='s')
-    timestamps['Marked Timestamp'] = pd.to_datetime(timestamps['Marked Timestamp'], unit='s')
+    # Keep timestamps as float64 seconds for direct numeric comparisons
+    ts = rr_data['Timestamp'].to_numpy(dtype=np.float64)
+    bounds = timestamps['Marked Timestamp'].to_numpy(dtype=np.float64)
 
     # Clean RR intervals
-    rr_data['Cleaned Value'] = clean_rr_intervals(rr_data['Value'].values)
+    try:
+        cleaned = clean_rr_intervals(rr_data['Value'].to_numpy(dtype=np.float64))
+    except ValueError as e:
+        print(f"Cannot clean RR intervals for {participant} ({e}). Skipping.")
+        return {column: [] for column in RESULT_COLUMNS}
 
     # Overall RMSSD, SDNN, and pNN50
-    overall_rmssd = calculate_rmssd(rr_data['Cleaned Value'])
-    overall_sdnn = calculate_sdnn(rr_data['Cleaned Value'])
-    overall_pnn50 = calculate_pnn50(rr_data['Cleaned Value'])
+    overall_rmssd = calculate_rmssd(cleaned)
+    overall_sdnn = calculate_sdnn(cleaned)
+    overall_pnn50 = calculate_pnn50(cleaned)
+
+    # Row index of every marked timestamp (recordings are written in time order)
+    edges = np.searchsorted(ts, bounds, side='left')
+
+    # Running sums over the recording, so each segment's metrics come from two lookups.
+    # Values are centred on the mean to keep the sum of squares numerically stable.
+    centred = cleaned - cleaned.mean()
+    sum_x = np.concatenate(([0.0], np.cumsum(centred)))
+    sum_x2 = np.concatenate(([0.0], np.cumsum(centred ** 2)))
+    diff = np.diff(cleaned)
+    sum_diff2 = np.concatenate(([0.0], np.cumsum(diff ** 2)))
+    count_nn50 = np.concatenate(([0], np.cumsum(np.abs(diff) > 50)))
 
     segment_count = 1
 
     # RMSSD, SDNN, and pNN50 between timestamps
-    for i in range(len(timestamps) - 1):
-        start = timestamps.iloc[i]['Marked Timestamp']
-        end = timestamps.iloc[i + 1]['Marked Timestamp']
-
-        # Filter RR intervals within the timestamp range
-        interval_data = rr_data[(rr_data['Timestamp'] >= start) & (rr_data['Timestamp'] < end)]
-
-        if len(interval_data) > 1:
-            rmssd = calculate_rmssd(interval_data['Cleaned Value'].values)
-            sdnn = calculate_sdnn(interval_data['Cleaned Value'].values)
-            pnn50 = calculate_pnn50(interval_data['Cleaned Value'].values)
+    for i in range(len(bounds) - 1):
+        # RR intervals within [start, end)
+        start, end = edges[i], edges[i + 1]
+        n = end - start
+
+        if n > 1:
+            rmssd = np.sqrt((sum_diff2[end - 1] - sum_diff2[start]) / (n - 1))
+            segment_sum = sum_x[end] - sum_x[start]
+            sdnn = np.sqrt(max(sum_x2[end] - sum_x2[start] - segment_sum * segment_sum / n, 0.0) / (n - 1))
+            pnn50 = (count_nn50[end - 1] - count_nn50[start]) / n * 100
         else:
             rmssd = None
             sdnn = None
             pnn50 = None
 
-        results.append({
-            "Participant": f"Participant_hrv_{participant}",
-            "Segment": f"Segment_{segment_count}",
-            "RMSSD": rmssd,
-            "SDNN": sdnn,
-            "pNN50": pnn50
-        })
+        segment_col.append(f"Segment_{segment_count}")
+        rmssd_col.append(rmssd)
+        sdnn_col.append(sdnn)
+        pnn50_col.append(pnn50)
 
         segment_count += 1
 
     # Add overall metrics
-    results.append({
-        "Participant": f"Participant_hrv_{participant}",
-        "Segment": "Overall",
-        "RMSSD": overall_rmssd,
-        "SDNN": overall_sdnn,
-        "pNN50": overall_pnn50
-    })
-
-# Create a DataFrame for all results
-hrv_df = pd.DataFrame(results)
-
-# Save to CSV
-output_file = "./hrv_values.csv"
-hrv_df.to_csv(output_file, index=False)
-
-print(f"HRV values saved to {output_file}")
+    segment_col.append("Overall")
+    rmssd_col.append(overall_rmssd)
+    sdnn_col.append(overall_sdnn)
+    pnn50_col.append(overall_pnn50)
+
+    return {
+        "Participant": [f"Participant_hrv_{participant}"] * len(segment_col),
+        "Segment": segment_col,
+        "RMSSD": rmssd_col,
+        "SDNN": sdnn_col,
+        "pNN50": pnn50_col
+    }
+
+
+def main():
+    # Collect all folders inside Participant_Data
+    participant_dirs = []
+    for participant in os.listdir(base_dir):
+        participant_dir = os.path.join(base_dir, participant)
+
+        if not os.path.isdir(participant_dir):
+            continue  # Skip files
+
+        participant_dirs.append((participant, participant_dir))
+
+    # Participants are independent, so process them in parallel worker processes
+    results = {column: [] for column in RESULT_COLUMNS}
+    with ProcessPoolExecutor() as executor:
+        futures = [executor.submit(process_participant, participant_dir, participant)
+                   for participant, participant_dir in participant_dirs]
+        # Collect in submission order so the output file is deterministic
+        for future in futures:
+            participant_results = future.result()
+            for column in RESULT_COLUMNS:
+                results[column].extend(participant_results[column])
+
+    # Create a DataFrame for all results
+    hrv_df = pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+    # Save to CSV
+    output_file = "./hrv_values.csv"
+    hrv_df.to_csv(output_file, index=False, float_format='%.4f')
+
+    print(f"HRV values saved to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
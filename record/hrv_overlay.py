@@ -1,7 +1,16 @@
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # Batch script: render straight to files, no GUI backend
 import matplotlib.pyplot as plt
 import os
 
+# Metric column and y-axis label of each generated graph
+HRV_METRICS = [
+    ("RMSSD", "RMSSD (ms)"),
+    ("SDNN", "SDNN (ms)"),
+    ("pNN50", "pNN50 (%)"),
+]
+
 
 def generate_hrv_graphs(data_file, participants_per_group=2):
     # Load the data
@@ -14,6 +23,9 @@ def generate_hrv_graphs(data_file, participants_per_group=2):
     base_folder = "group_graphs"
     os.makedirs(base_folder, exist_ok=True)
 
+    # One figure is reused for every graph, only its axes contents are redrawn
+    fig, ax = plt.subplots(figsize=(10, 5))
+
     # Iterate through participants in groups
     group_number = 1
     for i in range(0, len(participants), participants_per_group):
@@ -21,65 +33,31 @@ def generate_hrv_graphs(data_file, participants_per_group=2):
         group_folder = os.path.join(base_folder, f"group_{group_number}")
         os.makedirs(group_folder, exist_ok=True)
 
-        # Filter data for the current group
-        filtered_data = hrv_data[hrv_data["Participant"].isin(group_participants)]
-
-        # Generate graph for RMSSD
-        plt.figure(figsize=(10, 5))
-        for participant in group_participants:
-            participant_data = filtered_data[filtered_data["Participant"] == participant]
-            plt.plot(
-                participant_data["Segment"],
-                participant_data["RMSSD"],
-                marker="o",
-                label=participant,
-            )
-        plt.title(f"Group {group_number} - RMSSD Over Segments")
-        plt.xlabel("Segment")
-        plt.ylabel("RMSSD (ms)")
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(os.path.join(group_folder, f"rmssd_group_{group_number}.png"))
-        plt.close()
+        # Split the data of the current group per participant once
+        participant_rows = [(participant, hrv_data[hrv_data["Participant"] == participant])
+                            for participant in group_participants]
 
-        # Generate graph for SDNN
-        plt.figure(figsize=(10, 5))
-        for participant in group_participants:
-            participant_data = filtered_data[filtered_data["Participant"] == participant]
-            plt.plot(
-                participant_data["Segment"],
-                participant_data["SDNN"],
-                marker="o",
-                label=participant,
-            )
-        plt.title(f"Group {group_number} - SDNN Over Segments")
-        plt.xlabel("Segment")
-        plt.ylabel("SDNN (ms)")
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(os.path.join(group_folder, f"sdnn_group_{group_number}.png"))
-        plt.close()
-
-        # Generate graph for pNN50
-        plt.figure(figsize=(10, 5))
-        for participant in group_participants:
-            participant_data = filtered_data[filtered_data["Participant"] == participant]
-            plt.plot(
-                participant_data["Segment"],
-                participant_data["pNN50"],
-                marker="o",
-                label=participant,
-            )
-        plt.title(f"Group {group_number} - pNN50 Over Segments")
-        plt.xlabel("Segment")
-        plt.ylabel("pNN50 (%)")
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(os.path.join(group_folder, f"pnn50_group_{group_number}.png"))
-        plt.close()
+        # Generate graphs for RMSSD, SDNN and pNN50
+        for metric, ylabel in HRV_METRICS:
+            ax.clear()
+            for participant, participant_data in participant_rows:
+                ax.plot(
+                    participant_data["Segment"],
+                    participant_data[metric],
+                    marker="o",
+                    label=participant,
+                )
+            ax.set_title(f"Group {group_number} - {metric} Over Segments")
+            ax.set_xlabel("Segment")
+            ax.set_ylabel(ylabel)
+            ax.legend()
+            ax.grid(True)
+            fig.savefig(os.path.join(group_folder, f"{metric.lower()}_group_{group_number}.png"))
 
         group_number += 1
 
+    plt.close(fig)
+
 
 # Path to the simulated data file
 data_file = "hrv_values.csv"
@@ -1,4 +1,20 @@
-from pylsl import StreamInlet, resolve_stream, StreamInfo, StreamOutlet
+import time
+import numpy as np
+from pylsl import (StreamInlet, resolve_stream, StreamInfo, StreamOutlet,
+                   cf_float32, cf_double64, cf_int32, cf_int16, cf_int8)
+
+CHUNK_SIZE = 32  # Max samples moved per pull/push
+OUTLET_MAX_BUFFERED = 10  # Seconds of data the outlet keeps for a lagging consumer
+INLET_MAX_BUFLEN = 10  # Seconds of data the inlet buffers before dropping the oldest
+
+# Buffer dtype for each numeric LSL channel format the source stream may use
+SAMPLE_DTYPES = {
+    cf_float32: np.float32,
+    cf_double64: np.float64,
+    cf_int32: np.int32,
+    cf_int16: np.int16,
+    cf_int8: np.int8,
+}
 
 
 def main():
@@ -12,23 +28,61 @@ def main():
         print(f"No streams named '{stream_name}' of type '{stream_type}' found.")
         return
 
-    inlet = StreamInlet(streams[0])
+    source_dtype = SAMPLE_DTYPES.get(streams[0].channel_format())
+    if source_dtype is None:
+        print(f"Stream '{stream_name}' has an unsupported channel format.")
+        return
+
+    inlet = StreamInlet(streams[0], max_buflen=INLET_MAX_BUFLEN, recover=True)
     print(f"Stream '{stream_name}' found, setting up inlet...")
-    print(f"Connected to {inlet.info().name()} from {inlet.info().hostname()}.")
+    print(f"Connected to {streams[0].name()} from {streams[0].hostname()}.")
 
     # Create a new stream to send data forward
     info = StreamInfo('HeartRate', 'ExciteOMeter', 1, 10, 'float32', 'hrStream')
-    outlet = StreamOutlet(info)
+    # No chunk_size: at 10 Hz a 32-sample transmit chunk would hold samples back for seconds
+    outlet = StreamOutlet(info, max_buffered=OUTLET_MAX_BUFFERED)
+
+    # Preallocated buffers: liblsl fills dest_obj in the source's format,
+    # a second buffer is only needed when the forwarded stream uses a different one
+    buffer = np.empty((CHUNK_SIZE, 1), dtype=source_dtype)
+    rest = buffer[1:]
+    if source_dtype is np.float32:
+        out_buffer = buffer
+    else:
+        out_buffer = np.empty((CHUNK_SIZE, 1), dtype=np.float32)
+
+    # Bind the methods used in the loop once
+    pull_sample = inlet.pull_sample
+    pull_chunk = inlet.pull_chunk
+    push_sample = outlet.push_sample
+    monotonic = time.monotonic
 
     try:
+        last_sample_time = monotonic()
         while True:
-            sample, timestamp = inlet.pull_sample(timeout=5.0)
-            if sample:
-                print(f"Timestamp: {timestamp}, Sample: {sample}")
-                # Forward the sample to the new stream
-                outlet.push_sample(sample)
-            else:
+            # Block for the first sample only, then drain what is already queued; a pull_chunk
+            # with a timeout would wait out the whole timeout unless a full chunk arrives
+            sample, timestamp = pull_sample(timeout=0.1)
+            if timestamp:
+                buffer[0] = sample
+                _, timestamps = pull_chunk(timeout=0.0, max_samples=CHUNK_SIZE - 1, dest_obj=rest)
+                timestamps.insert(0, timestamp)
+                n = len(timestamps)
+                # One console write per chunk rather than per sample
+                print("\n".join(f"Timestamp: {timestamp}, Sample: {sample.tolist()}"
+                                for timestamp, sample in zip(timestamps, buffer[:n])))
+                if out_buffer is not buffer:
+                    out_buffer[:n] = buffer[:n]
+                # Forward each sample with its own source timestamp: samples arrive irregularly, and
+                # push_chunk would derive all but the last timestamp from the nominal rate.
+                # The last push flushes (only because the outlet has no chunk_size, which would override it).
+                last = n - 1
+                for i in range(n):
+                    push_sample(out_buffer[i], timestamps[i], pushthrough=(i == last))
+                last_sample_time = monotonic()
+            elif monotonic() - last_sample_time >= 5.0:
                 print("No new sample available.")
+                last_sample_time = monotonic()
     except KeyboardInterrupt:
         print("Stream reading interrupted.")
 
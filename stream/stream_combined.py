@@ -1,49 +1,175 @@
-import threading
-from pylsl import StreamInlet, resolve_stream, StreamInfo, StreamOutlet
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+import numpy as np
 
-def restream(stream_name, stream_type, new_stream_name, new_stream_type, new_stream_frequency, new_stream_format):
-    print(f"Attempting to resolve the stream '{stream_name}' of type '{stream_type}'...")
-    streams = resolve_stream('name', stream_name)
+CHUNK_SIZE = 32  # Max samples moved per pull/push
+INLET_MAX_BUFLEN = 10  # Seconds of data each inlet buffers before dropping the oldest
+
+# Buffer dtype for each numeric LSL channel format a source or forwarded stream may use
+SAMPLE_DTYPES = {
+    'float32': np.float32,
+    'double64': np.float64,
+    'int32': np.int32,
+    'int16': np.int16,
+    'int8': np.int8,
+}
+
+# Restream processes log through a queue to the parent, so console writes never block their loop
+logger = logging.getLogger("restream")
+
+def restream(stream_name, stream_type, new_stream_name, new_stream_type, new_stream_frequency, new_stream_format,
+             regular_rate, outlet_chunk_size, outlet_max_buffered, core_id, log_queue, stop_event):
+    # Ctrl+C reaches the whole process group; the parent handles it and stops us through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+
+    # Keep this process on its own core so the scheduler doesn't bounce it around (Linux only)
+    if core_id is not None:
+        try:
+            os.sched_setaffinity(0, {core_id})
+        except OSError as e:
+            logger.warning("Could not pin %s restream to core %s: %s", stream_name, core_id, e)
+
+    # Imported here so every restream process initialises its own liblsl
+    from pylsl import (StreamInlet, resolve_byprop, StreamInfo, StreamOutlet,
+                       cf_float32, cf_double64, cf_int32, cf_int16, cf_int8)
+
+    logger.info("Attempting to resolve the stream '%s' of type '%s'...", stream_name, stream_type)
+    # Resolve in short rounds, so a stop request doesn't wait for a stream that never shows up
+    streams = []
+    while not streams and not stop_event.is_set():
+        streams = resolve_byprop('name', stream_name, timeout=1.0)
 
     if not streams:
-        print(f"No streams named '{stream_name}' of type '{stream_type}' found.")
+        logger.error("No streams named '%s' of type '%s' found.", stream_name, stream_type)
         return
 
-    inlet = StreamInlet(streams[0])
-    print(f"Stream '{stream_name}' found, setting up inlet...")
-    print(f"Connected to {inlet.info().name()} from {inlet.info().hostname()}.")
+    source_format = {
+        cf_float32: 'float32',
+        cf_double64: 'double64',
+        cf_int32: 'int32',
+        cf_int16: 'int16',
+        cf_int8: 'int8',
+    }.get(streams[0].channel_format())
+    if source_format is None:
+        logger.error("Stream '%s' has an unsupported channel format.", stream_name)
+        return
+
+    inlet = StreamInlet(streams[0], max_buflen=INLET_MAX_BUFLEN, recover=True)
+    logger.info("Stream '%s' found, setting up inlet...", stream_name)
+    logger.info("Connected to %s from %s.", streams[0].name(), streams[0].hostname())
 
     # Create a new stream to send data forward
     info = StreamInfo(new_stream_name, new_stream_type, 1, new_stream_frequency, new_stream_format, f'{new_stream_name}Stream')
-    outlet = StreamOutlet(info)
+    outlet = StreamOutlet(info, chunk_size=outlet_chunk_size, max_buffered=outlet_max_buffered)
 
-    try:
-        print(f"{new_stream_name} Stream is active.")
-        while True:
-            sample, timestamp = inlet.pull_sample(timeout=5.0)
-            if sample:
-                # Forward the sample to the new stream
-                outlet.push_sample(sample)
-            else:
-                print(f"No new sample available for {stream_name}.")
-    except KeyboardInterrupt:
-        print(f"Stream reading for {stream_name} interrupted.")
+    # Give downstream tools a moment to connect so the first samples are not pushed to nobody
+    if not outlet.wait_for_consumers(2.0):
+        logger.info("%s: no consumers yet, starting anyway", new_stream_name)
+
+    # Preallocated buffers typed once for this stream: liblsl fills dest_obj in the source's format,
+    # a second buffer is only needed when the forwarded stream uses a different one
+    buffer = np.empty((CHUNK_SIZE, 1), dtype=SAMPLE_DTYPES[source_format])
+    rest = buffer[1:]
+    if source_format == new_stream_format:
+        out_buffer = buffer
+    else:
+        out_buffer = np.empty((CHUNK_SIZE, 1), dtype=SAMPLE_DTYPES[new_stream_format])
+
+    # Bind the methods used in the loop once; pylsl resolves the typed liblsl functions at construction
+    pull_sample = inlet.pull_sample
+    pull_chunk = inlet.pull_chunk
+    push_chunk = outlet.push_chunk
+    push_sample = outlet.push_sample
+    have_consumers = outlet.have_consumers
+    is_stopped = stop_event.is_set
+    monotonic = time.monotonic
+
+    logger.info("%s Stream is active.", new_stream_name)
+    last_sample_time = monotonic()
+    while not is_stopped():
+        # pylsl binds liblsl through ctypes.CDLL, which already releases the GIL while this blocks.
+        # Block for the first sample only, then drain what is already queued: a pull_chunk with a
+        # timeout waits out the whole timeout unless CHUNK_SIZE samples arrive first.
+        sample, timestamp = pull_sample(timeout=1.0)
+        if timestamp:
+            buffer[0] = sample
+            _, timestamps = pull_chunk(timeout=0.0, max_samples=CHUNK_SIZE - 1, dest_obj=rest)
+            timestamps.insert(0, timestamp)
+            n = len(timestamps)
+            # Forward the chunk to the new stream with its source timestamps.
+            # Without consumers the chunk is dropped; it is still pulled so no backlog builds up.
+            # pushthrough cannot flush early: a larger outlet chunk_size overrides it, see main().
+            # push_chunk only hands the samples to the outlet's send queue; liblsl's own IO thread
+            # does the network send, so the next pull overlaps with it without a queue of our own.
+            if have_consumers():
+                if out_buffer is not buffer:
+                    out_buffer[:n] = buffer[:n]
+                if regular_rate:
+                    # liblsl derives the earlier timestamps from the nominal rate, which fits a regular stream
+                    push_chunk(out_buffer[:n], timestamps[-1], pushthrough=True)
+                else:
+                    # Irregular samples keep their own source timestamps; the last push flushes
+                    last = n - 1
+                    for i in range(n):
+                        push_sample(out_buffer[i], timestamps[i], pushthrough=(i == last))
+            last_sample_time = monotonic()
+        elif monotonic() - last_sample_time >= 5.0:
+            logger.warning("No new sample available for %s.", stream_name)
+            last_sample_time = monotonic()
+    logger.info("Stream reading for %s interrupted.", stream_name)
 
 def main():
+    # Source name/type, forwarded name/type, rate, format, whether samples really arrive at that rate,
+    # outlet chunk size, outlet buffer (seconds).
+    # A chunk size of 0 sends each push as one chunk; a larger one overrides pushthrough and holds
+    # samples until that many are queued, which at 130 Hz would add ~250 ms for 32.
     streams = [
-        ('RawECG', 'ExciteOMeter', 'RawECG', 'ExciteOMeter', 130, 'int32'),
-        ('HeartRate', 'ExciteOMeter', 'HeartRate', 'ExciteOMeter', 10, 'float32'),
-        ('RRinterval', 'ExciteOMeter', 'RRinterval', 'ExciteOMeter', 10, 'float32')
+        ('RawECG', 'ExciteOMeter', 'RawECG', 'ExciteOMeter', 130, 'int32', True, 0, 10),
+        ('HeartRate', 'ExciteOMeter', 'HeartRate', 'ExciteOMeter', 10, 'float32', False, 1, 60),
+        ('RRinterval', 'ExciteOMeter', 'RRinterval', 'ExciteOMeter', 10, 'float32', False, 1, 60)
     ]
 
-    threads = []
-    for stream in streams:
-        thread = threading.Thread(target=restream, args=stream)
-        threads.append(thread)
-        thread.start()
+    # One process per stream, so each restreamer has its own interpreter and GIL
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+
+    # Print the log records of all restream processes from a listener thread in this process
+    log_queue = context.Queue()
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    listener.start()
 
-    for thread in threads:
-        thread.join()
+    # Pin the processes to the 2nd, 3rd, ... core this process may use, leaving the first to the OS and
+    # the parent. Without a core for each of them, or without affinity support, leave it to the scheduler.
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    pin_cores = len(cores) >= len(streams) + 1
+
+    processes = []
+    for index, stream in enumerate(streams):
+        core_id = cores[index + 1] if pin_cores else None
+        process = context.Process(target=restream, args=(*stream, core_id, log_queue, stop_event))
+        processes.append(process)
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("Stopping restream processes...")
+        stop_event.set()
+        for process in processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+    finally:
+        listener.stop()
 
 if __name__ == '__main__':
     main()
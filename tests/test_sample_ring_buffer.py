@@ -0,0 +1,68 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("bleak")
+pytest.importorskip("pylsl")
+
+_spec = importlib.util.spec_from_file_location(
+    "lsl_lab", os.path.join(os.path.dirname(__file__), "..", "record", "LSL-Lab.py"))
+lsl_lab = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(lsl_lab)
+SampleRingBuffer = lsl_lab.SampleRingBuffer
+
+
+class _AppendDuringCopy:
+    """Stands in for the buffer's array and runs producer steps right before the consumer's copy"""
+
+    def __init__(self, buffer, producer_steps):
+        self._buffer = buffer
+        self._array = buffer._data
+        self._steps = list(producer_steps)
+
+    def __setitem__(self, index, value):
+        self._array[index] = value
+
+    def __getitem__(self, index):
+        steps, self._steps = self._steps, []
+        for step in steps:
+            step()
+        return self._array[index]
+
+
+def _filled(capacity, n):
+    buffer = SampleRingBuffer(capacity)
+    for i in range(n):
+        buffer.append(float(i), float(i))
+    return buffer
+
+
+def _write_slot_only(buffer, sample):
+    # First half of append: the slot is written, the new count is not published yet
+    buffer._data[buffer.count & buffer._mask] = (sample, sample)
+
+
+def test_window_returns_samples_oldest_first():
+    buffer = _filled(8, 11)
+    timestamps, values = buffer.window(since=5.0)
+    assert timestamps.tolist() == [5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+    assert values.tolist() == timestamps.tolist()
+
+
+def test_window_skips_slot_being_written_when_full():
+    buffer = _filled(8, 8)
+    _write_slot_only(buffer, 8.0)
+    timestamps, _ = buffer.window(since=-np.inf)
+    assert timestamps.tolist() == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0]
+
+
+def test_window_drops_slots_appended_during_copy():
+    buffer = _filled(8, 10)
+    steps = [lambda i=i: buffer.append(float(i), float(i)) for i in range(10, 13)]
+    steps.append(lambda: _write_slot_only(buffer, 13.0))
+    buffer._data = _AppendDuringCopy(buffer, steps)
+    timestamps, _ = buffer.window(since=-np.inf)
+    assert timestamps.tolist() == sorted(timestamps.tolist())
+    assert timestamps.tolist() == [6.0, 7.0, 8.0, 9.0]